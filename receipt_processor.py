@@ -1,62 +1,383 @@
 import streamlit as st
 import boto3
+import pandas as pd
+import numpy as np
+from botocore.config import Config
 import os
 import re
 from datetime import datetime
 from pathlib import Path
 import json
+import hashlib
+import tempfile
 from typing import Dict, List, Tuple, Optional
 import logging
-import tkinter as tk
-from tkinter import filedialog
 import threading
+import queue
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from contextlib import nullcontext
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick is optional; keywords are then found with substring checks
+    ahocorasick = None
+import io
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def select_folder():
-    """Open folder selection dialog"""
-    root = tk.Tk()
-    root.withdraw()  # Hide the main window
-    root.attributes('-topmost', True)  # Bring dialog to front
-    
-    folder_path = filedialog.askdirectory(
-        title="Select folder containing receipt images",
-        initialdir=os.path.expanduser("~")  # Start from user's home directory
+# Textract results are persisted here, keyed by the SHA-256 of the image bytes
+_CACHE_DIR = Path.home() / '.cache' / 'receipt_processor'
+
+# Folders with more receipts than this are sent through asynchronous Textract jobs
+# when an S3 bucket is configured
+_ASYNC_BATCH_THRESHOLD = 20
+_ASYNC_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tiff', '.pdf')
+_ASYNC_MAX_CONCURRENT_JOBS = 20  # Keep below the account's concurrent job quota
+_ASYNC_UPLOAD_WORKERS = 16
+
+# Minimum seconds between progress updates sent to the browser
+_PROGRESS_INTERVAL = 0.5
+
+# Upper bound on in-memory cached Textract and classification results
+_MEMO_MAX_ENTRIES = 1024
+
+# Synchronous Textract rejects documents larger than this; bigger images are downscaled first
+_MAX_SYNC_BYTES = 5 * 1024 * 1024
+
+# JPEG qualities tried when shrinking an image, and the shortest side it may be scaled down to
+_SHRINK_QUALITIES = (85, 70, 55)
+_SHRINK_MIN_SIDE = 1000
+
+# Cap on Textract requests in flight at once across all sessions
+_MAX_INFLIGHT_REQUESTS = 32
+
+# Keywords for different receipt types
+_RECEIPT_KEYWORDS = {
+    'Restaurant': ['restaurant', 'cafe', 'dining', 'food', 'meal', 'grill', 'pizza', 'burger', 'sushi'],
+    'Parking': ['parking', 'garage', 'valet', 'meter', 'lot'],
+    'Gas': ['gas', 'fuel', 'petrol', 'station', 'shell', 'exxon', 'bp', 'chevron'],
+    'Grocery': ['grocery', 'supermarket', 'market', 'food', 'walmart', 'target', 'kroger', 'safeway'],
+    'Retail': ['store', 'shop', 'retail', 'clothing', 'electronics', 'amazon', 'best buy'],
+    'Transportation': ['uber', 'lyft', 'taxi', 'transport', 'bus', 'train', 'subway'],
+    'Entertainment': ['movie', 'theater', 'cinema', 'concert', 'show', 'ticket', 'amusement'],
+    'Healthcare': ['pharmacy', 'drug', 'medical', 'doctor', 'hospital', 'clinic', 'cvs', 'walgreens'],
+    'Utilities': ['electric', 'water', 'gas', 'internet', 'phone', 'utility', 'bill']
+}
+
+# Each keyword mapped to the receipt types it scores
+_KEYWORD_TYPES = {}
+for _receipt_type, _keywords in _RECEIPT_KEYWORDS.items():
+    for _keyword in _keywords:
+        _KEYWORD_TYPES.setdefault(_keyword, []).append(_receipt_type)
+
+def _build_keyword_automaton():
+    """Build an Aho-Corasick automaton mapping each keyword to the receipt types it scores"""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for keyword, receipt_types in _KEYWORD_TYPES.items():
+        automaton.add_word(keyword, (keyword, tuple(receipt_types)))
+    automaton.make_automaton()
+    return automaton
+
+# Finds every keyword in a single pass over the text
+_KEYWORD_AUTOMATON = _build_keyword_automaton()
+
+def _find_keywords(text: str):
+    """Yield (keyword, receipt types) for each keyword occurrence in case-folded text"""
+    if _KEYWORD_AUTOMATON is not None:
+        for _, value in _KEYWORD_AUTOMATON.iter(text):
+            yield value
+    else:
+        for keyword, receipt_types in _KEYWORD_TYPES.items():
+            if keyword in text:
+                yield keyword, receipt_types
+
+_MONTH_MAP = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12
+}
+
+# English month names for formatting dates, independent of the system locale
+_MONTHS = ('', 'January', 'February', 'March', 'April', 'May', 'June', 'July',
+           'August', 'September', 'October', 'November', 'December')
+
+# Date patterns, compiled once at import. The flag marks patterns that capture a month name.
+# They are deliberately searched one after another: a fused alternation has to
+# try every branch at every position and measured about 3x slower on long receipts.
+_DATE_PATTERNS = [
+    (re.compile(pattern, re.IGNORECASE), is_month_name)
+    for pattern, is_month_name in (
+        (r'(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})', False),  # MM/DD/YYYY or DD/MM/YYYY
+        (r'(\d{1,2})\s+(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\s+(\d{2,4})', True),  # DD Month YYYY
+        (r'(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\s+(\d{1,2}),?\s+(\d{2,4})', True),  # Month DD, YYYY
     )
+]
+
+# Enhanced total patterns - look for various receipt total indicators.
+# All branches are fused into one alternation so the text is scanned once;
+# the matching branch is reported by name and mapped to its selection
+# priority (higher wins). Branches are listed from highest to lowest priority
+# so the best one wins when several could match at the same position.
+_TOTAL_BRANCHES = [
+    # Primary total patterns
+    ('grand_total', r'grand\s+total[:\s]*\$?(\d+\.?\d*)', 10),
+    ('total_due', r'total\s+due[:\s]*\$?(\d+\.?\d*)', 9),
+    ('final_total', r'final\s+total[:\s]*\$?(\d+\.?\d*)', 9),
+    ('subtotal', r'sub\s*total[:\s]*\$?(\d+\.?\d*)', 9),  # Subtotal (often the final amount)
+    ('total', r'total[:\s]*\$?(\d+\.?\d*)', 9),
+    ('amount_due', r'amount\s+due[:\s]*\$?(\d+\.?\d*)', 7),
+    ('final_amount', r'final\s+amount[:\s]*\$?(\d+\.?\d*)', 7),
+    ('amount', r'amount[:\s]*\$?(\d+\.?\d*)', 7),
+    ('value', r'value[:\s]*\$?(\d+\.?\d*)', 7),
+    ('balance_due', r'balance\s+due[:\s]*\$?(\d+\.?\d*)', 6),
+    ('balance', r'balance[:\s]*\$?(\d+\.?\d*)', 6),
+    ('charge', r'charge[:\s]*\$?(\d+\.?\d*)', 5),
+    ('payment', r'payment[:\s]*\$?(\d+\.?\d*)', 5),
+    
+    # Amounts with currency symbols, including dollar amounts at the end of lines
+    ('currency', r'[$£€¥](\d+\.?\d*)', 5),
     
-    root.destroy()
-    return folder_path
+    # Amounts in parentheses (sometimes used for totals)
+    ('parenthesized', r'\([$£€¥]?(\d+\.?\d*)\)', 5),
+    
+    # Amounts with "USD" or "CAD" etc.
+    ('currency_code', r'(\d+\.?\d*)\s*(?:USD|CAD|EUR|GBP)', 5),
+]
+_TOTAL_RE = re.compile(
+    '|'.join(f'(?P<{name}>{pattern})' for name, pattern, _ in _TOTAL_BRANCHES),
+    re.IGNORECASE
+)
+_TOTAL_PRIORITY = {name: priority for name, _, priority in _TOTAL_BRANCHES}
+
+# Characters that are not allowed in filenames on Windows
+_BAD_FN_CHARS = re.compile(r'[<>:"/\\|?*]')
+
+def _warm_up_connection(textract_client):
+    """Make a cheap Textract call to set up a pooled connection; the outcome doesn't matter"""
+    try:
+        textract_client.list_adapters(MaxResults=1)
+    except Exception as e:
+        logger.debug(f"Textract warm-up call failed: {str(e)}")
 
 # Initialize AWS clients
-@st.cache_resource
+@st.cache_resource(max_entries=1)
 def init_aws_clients():
     """Initialize AWS clients using configured credentials"""
     try:
-        textract = boto3.client('textract', region_name='us-east-1')
-        comprehend = boto3.client('comprehend', region_name='us-east-1')
-        return textract, comprehend
+        # Adaptive retries back off exponentially with jitter on throttling
+        # (ThrottlingException, ProvisionedThroughputExceededException), 5xx errors
+        # (InternalServerError, ServiceUnavailable) and connection or read timeouts,
+        # and a pool larger than the worker count keeps every thread on a warm connection
+        config = Config(
+            region_name='us-east-1',
+            max_pool_connections=64,
+            tcp_keepalive=True,
+            retries={'max_attempts': 10, 'mode': 'adaptive'}
+        )
+        session = boto3.session.Session()
+        textract = session.client('textract', config=config)
+        s3 = session.client('s3', config=config)
+        # Open the first Textract connection in the background so the first receipt
+        # doesn't pay for the TLS handshake
+        threading.Thread(target=_warm_up_connection, args=(textract,), daemon=True).start()
+        return textract, s3
     except Exception as e:
         logger.error(f"Failed to initialize AWS clients: {str(e)}")
         return None, None
 
-def extract_text_from_image(textract_client, image_path: str) -> str:
-    """Extract text from an image using Amazon Textract"""
+class RateLimiter:
+    """Limit concurrent calls with a semaphore and space them out to a maximum rate"""
+    
+    def __init__(self, requests_per_second: float, max_inflight: int):
+        self._interval = 1.0 / requests_per_second
+        self._semaphore = threading.Semaphore(max_inflight)
+        self._lock = threading.Lock()
+        self._next_call = 0.0
+    
+    def __enter__(self):
+        self._semaphore.acquire()
+        # Reserve the next free slot under the lock, then sleep outside it
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_call)
+            self._next_call = slot + self._interval
+        time.sleep(slot - now)
+        return self
+    
+    def __exit__(self, *exc_info):
+        self._semaphore.release()
+
+@st.cache_resource
+def get_rate_limiter(service: str, requests_per_second: float) -> RateLimiter:
+    """Shared rate limiter for one AWS API family, so every session counts against the same quota"""
+    return RateLimiter(requests_per_second, _MAX_INFLIGHT_REQUESTS)
+
+class MemoCache:
+    """Thread-safe mapping that keeps only the most recently used max_entries items"""
+    
+    def __init__(self, max_entries: int):
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """Return the cached value for key, or None"""
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+    
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+@st.cache_resource
+def get_memo_cache() -> MemoCache:
+    """In-memory results shared by every session; fetch it on the script thread and hand it to workers"""
+    return MemoCache(_MEMO_MAX_ENTRIES)
+
+def _check_readable(image_path: str):
+    """Raise FileNotFoundError or PermissionError if an image file can't be read"""
+    if not os.path.exists(image_path):
+        raise FileNotFoundError(f"File not found: {image_path}")
+    if not os.access(image_path, os.R_OK):
+        raise PermissionError(f"No read permission for file: {image_path}")
+
+def _read_bytes(image_path: str) -> bytes:
+    """Read the raw bytes of an image file"""
+    _check_readable(image_path)
+    return Path(image_path).read_bytes()
+
+def _file_digest(image_path: str) -> str:
+    """SHA-256 of an image file, read in chunks so the whole file is never held in memory"""
+    _check_readable(image_path)
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as image_file:
+        for chunk in iter(lambda: image_file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _cache_file(digest: str) -> Path:
+    """Path of the on-disk Textract cache entry for an image with the given SHA-256"""
+    return _CACHE_DIR / f"{digest}.txt"
+
+def _read_cache(cache_file: Path) -> Optional[str]:
+    """Return a cached text, or None if there is no entry or it can't be read (treated as a cache miss)"""
+    if not cache_file.exists():
+        return None
     try:
-        if not os.path.exists(image_path):
-            raise FileNotFoundError(f"File not found: {image_path}")
-        if not os.access(image_path, os.R_OK):
-            raise PermissionError(f"No read permission for file: {image_path}")
-        with open(image_path, 'rb') as image_file:
-            image_bytes = image_file.read()
-        
+        return cache_file.read_text(encoding='utf-8')
+    except (OSError, UnicodeDecodeError) as e:
+        logger.warning(f"Ignoring unreadable Textract cache file {cache_file}: {str(e)}")
+        return None
+
+def _write_cache(cache_file: Path, extracted_text: str):
+    """Persist extracted text, logging rather than failing if the cache is not writable"""
+    try:
+        _CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # Write a temporary file and move it into place so concurrent readers
+        # never see a truncated or partially written entry
+        fd, temp_path = tempfile.mkstemp(dir=_CACHE_DIR, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as temp_file:
+                temp_file.write(extracted_text)
+            os.replace(temp_path, cache_file)
+        except OSError:
+            os.remove(temp_path)
+            raise
+    except OSError as e:
+        logger.warning(f"Could not write Textract cache file {cache_file}: {str(e)}")
+
+def _lines_to_text(blocks: List[Dict]) -> str:
+    """Join the LINE blocks of a Textract response into a single string"""
+    return ' '.join([item['Text'] for item in blocks if item['BlockType'] == 'LINE'])
+
+def _shrink_image(image_bytes: bytes) -> bytes:
+    """Downscale and re-encode an image until it fits within the synchronous Textract size limit"""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.thumbnail((4096, 4096))
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        while True:
+            # Lower the JPEG quality first, then the resolution while text stays legible
+            for quality in _SHRINK_QUALITIES:
+                buffer = io.BytesIO()
+                image.save(buffer, format='JPEG', quality=quality)
+                if buffer.tell() <= _MAX_SYNC_BYTES:
+                    shrunk = buffer.getvalue()
+                    logger.info(f"Downscaled image from {len(image_bytes)} to {len(shrunk)} bytes "
+                                f"({len(image_bytes) / max(len(shrunk), 1):.1f}x smaller)")
+                    return shrunk
+            width, height = image.size
+            if min(width, height) * 3 // 4 < _SHRINK_MIN_SIDE:
+                raise ValueError(f"Image is larger than {_MAX_SYNC_BYTES // (1024 * 1024)}MB even after "
+                                 "downscaling, the limit for direct Textract calls")
+            image = image.resize((width * 3 // 4, height * 3 // 4))
+
+def _textract_detect(textract_client, digest: str, image_path: str, image_bytes: Optional[bytes] = None,
+                     limiter: Optional[RateLimiter] = None, memo: Optional[MemoCache] = None) -> str:
+    """Run Textract on an image identified by its SHA-256, reusing cached results.
+    
+    memo (in memory) and the on-disk cache are both keyed by the digest, and the
+    image is only read from image_path (unless image_bytes is given) when neither
+    has the text.
+    """
+    memo_key = ('text', digest)
+    if memo:
+        extracted_text = memo.get(memo_key)
+        if extracted_text is not None:
+            return extracted_text
+    
+    cache_file = _cache_file(digest)
+    extracted_text = _read_cache(cache_file)
+    if extracted_text is not None:
+        if memo:
+            memo.put(memo_key, extracted_text)
+        return extracted_text
+    
+    if image_bytes is None:
+        image_bytes = _read_bytes(image_path)
+    document_bytes = image_bytes
+    if len(image_bytes) > _MAX_SYNC_BYTES:
+        if image_bytes.startswith(b'%PDF'):
+            raise ValueError(f"PDF is larger than {_MAX_SYNC_BYTES // (1024 * 1024)}MB, "
+                             "the limit for direct Textract calls")
+        document_bytes = _shrink_image(image_bytes)
+    
+    with limiter or nullcontext():
         response = textract_client.detect_document_text(
-            Document={'Bytes': image_bytes}
+            Document={'Bytes': document_bytes}
         )
-        
-        extracted_text = ' '.join([item['Text'] for item in response['Blocks'] if item['BlockType'] == 'LINE'])
-        return extracted_text
+    
+    extracted_text = _lines_to_text(response['Blocks'])
+    _write_cache(cache_file, extracted_text)
+    if memo:
+        memo.put(memo_key, extracted_text)
+    return extracted_text
+
+def extract_text_from_image(textract_client, image_path: str, image_bytes: Optional[bytes] = None,
+                            limiter: Optional[RateLimiter] = None, memo: Optional[MemoCache] = None) -> str:
+    """Extract text from an image using Amazon Textract.
+    
+    If image_bytes is given (e.g. an uploaded file) it is used instead of reading image_path.
+    """
+    try:
+        if image_bytes is None:
+            digest = _file_digest(image_path)
+        else:
+            digest = hashlib.sha256(image_bytes).hexdigest()
+        return _textract_detect(textract_client, digest, image_path, image_bytes, limiter, memo)
     except FileNotFoundError as fnf:
         logger.error(str(fnf))
         return f"ERROR: {str(fnf)}"
@@ -67,112 +388,183 @@ def extract_text_from_image(textract_client, image_path: str) -> str:
         logger.error(f"Error extracting text from {image_path}: {str(e)}")
         return f"ERROR: {str(e)}"
 
-def classify_receipt(comprehend_client, text: str) -> str:
-    """Classify receipt type using Amazon Comprehend"""
+def _get_job_text(textract_client, job_id: str, response: Dict, limiter: Optional[RateLimiter] = None) -> str:
+    """Collect the text of a finished Textract job, starting from the first result page already fetched"""
+    blocks = []
+    while True:
+        blocks.extend(response.get('Blocks', []))
+        if 'NextToken' not in response:
+            return _lines_to_text(blocks)
+        with limiter or nullcontext():
+            response = textract_client.get_document_text_detection(JobId=job_id, NextToken=response['NextToken'])
+
+def process_receipts_async(textract_client, s3_client, bucket: str, image_paths: List[str],
+                           on_text=None, start_limiter: Optional[RateLimiter] = None,
+                           get_limiter: Optional[RateLimiter] = None,
+                           memo: Optional[MemoCache] = None) -> Dict[str, str]:
+    """Extract text from many images with asynchronous Textract jobs.
+    
+    Images are uploaded to a scratch prefix in the S3 bucket, at most
+    _ASYNC_MAX_CONCURRENT_JOBS text detection jobs run at once and the rest
+    are queued. Returns extracted text (or an "ERROR: ..." string) per path;
+    on_text(path, text) is called as soon as each one is known. Job starts go
+    through start_limiter and status polls and result pages through get_limiter,
+    since AWS sets separate quotas for the two APIs. Images already in memo or
+    the on-disk cache are not uploaded.
+    """
+    texts = {}
+    
+    def settle(image_path, text):
+        texts[image_path] = text
+        if on_text:
+            on_text(image_path, text)
+    
+    pending = deque()
+    cache_files = {}
+    digests = {}
+    
+    # Skip anything already in memory or in the on-disk cache
+    for image_path in image_paths:
+        try:
+            digests[image_path] = _file_digest(image_path)
+        except (FileNotFoundError, PermissionError) as e:
+            logger.error(str(e))
+            settle(image_path, f"ERROR: {str(e)}")
+            continue
+        extracted_text = memo.get(('text', digests[image_path])) if memo else None
+        cache_file = _cache_file(digests[image_path])
+        if extracted_text is None:
+            extracted_text = _read_cache(cache_file)
+            if extracted_text is not None and memo:
+                memo.put(('text', digests[image_path]), extracted_text)
+        if extracted_text is not None:
+            settle(image_path, extracted_text)
+        else:
+            cache_files[image_path] = cache_file
+    
+    prefix = f"receipt-processor/{uuid.uuid4().hex}/"
+    uploaded_keys = []
+    
+    def upload(image_path):
+        key = f"{prefix}{uuid.uuid4().hex}{Path(image_path).suffix.lower()}"
+        uploaded_keys.append(key)
+        s3_client.upload_file(image_path, bucket, key)
+        return key
+    
     try:
-        # Keywords for different receipt types
-        receipt_keywords = {
-            'Restaurant': ['restaurant', 'cafe', 'dining', 'food', 'meal', 'grill', 'pizza', 'burger', 'sushi'],
-            'Parking': ['parking', 'garage', 'valet', 'meter', 'lot'],
-            'Gas': ['gas', 'fuel', 'petrol', 'station', 'shell', 'exxon', 'bp', 'chevron'],
-            'Grocery': ['grocery', 'supermarket', 'market', 'food', 'walmart', 'target', 'kroger', 'safeway'],
-            'Retail': ['store', 'shop', 'retail', 'clothing', 'electronics', 'amazon', 'best buy'],
-            'Transportation': ['uber', 'lyft', 'taxi', 'transport', 'bus', 'train', 'subway'],
-            'Entertainment': ['movie', 'theater', 'cinema', 'concert', 'show', 'ticket', 'amusement'],
-            'Healthcare': ['pharmacy', 'drug', 'medical', 'doctor', 'hospital', 'clinic', 'cvs', 'walgreens'],
-            'Utilities': ['electric', 'water', 'gas', 'internet', 'phone', 'utility', 'bill']
-        }
-        
-        # Use Comprehend to detect entities and key phrases
-        entities_response = comprehend_client.detect_entities(Text=text, LanguageCode='en')
-        key_phrases_response = comprehend_client.detect_key_phrases(Text=text, LanguageCode='en')
-        
-        # Combine all detected text
-        all_text = text.lower()
-        entity_text = ' '.join([entity['Text'].lower() for entity in entities_response['Entities']])
-        phrase_text = ' '.join([phrase['Text'].lower() for phrase in key_phrases_response['KeyPhrases']])
+        with ThreadPoolExecutor(max_workers=_ASYNC_UPLOAD_WORKERS) as executor:
+            futures = {executor.submit(upload, image_path): image_path for image_path in cache_files}
+            for future in as_completed(futures):
+                image_path = futures[future]
+                try:
+                    pending.append((image_path, future.result()))
+                except Exception as e:
+                    logger.error(f"Error uploading {image_path} to S3: {str(e)}")
+                    settle(image_path, f"ERROR: {str(e)}")
         
-        combined_text = f"{all_text} {entity_text} {phrase_text}"
-        
-        # Score each receipt type
-        scores = {}
-        for receipt_type, keywords in receipt_keywords.items():
-            score = sum(1 for keyword in keywords if keyword in combined_text)
-            scores[receipt_type] = score
-        
-        # Return the type with highest score, default to 'Other' if no match
-        if max(scores.values()) > 0:
-            return max(scores, key=scores.get)
-        else:
-            return 'Other'
+        running = {}
+        delay = 1.0
+        while pending or running:
+            # Keep the number of in-flight jobs under the concurrency cap
+            while pending and len(running) < _ASYNC_MAX_CONCURRENT_JOBS:
+                image_path, key = pending.popleft()
+                try:
+                    with start_limiter or nullcontext():
+                        response = textract_client.start_document_text_detection(
+                            DocumentLocation={'S3Object': {'Bucket': bucket, 'Name': key}}
+                        )
+                    running[response['JobId']] = image_path
+                except Exception as e:
+                    logger.error(f"Error starting Textract job for {image_path}: {str(e)}")
+                    settle(image_path, f"ERROR: {str(e)}")
+            
+            if not running:
+                break
+            time.sleep(delay)
             
+            finished = 0
+            for job_id, image_path in list(running.items()):
+                try:
+                    with get_limiter or nullcontext():
+                        # Once the job is done this poll also returns the first page of results
+                        response = textract_client.get_document_text_detection(JobId=job_id)
+                    status = response['JobStatus']
+                    if status == 'IN_PROGRESS':
+                        continue
+                    if status in ('SUCCEEDED', 'PARTIAL_SUCCESS'):
+                        extracted_text = _get_job_text(textract_client, job_id, response, get_limiter)
+                        _write_cache(cache_files[image_path], extracted_text)
+                        if memo:
+                            memo.put(('text', digests[image_path]), extracted_text)
+                        settle(image_path, extracted_text)
+                    else:
+                        message = response.get('StatusMessage', status)
+                        settle(image_path, f"ERROR: Textract job failed: {message}")
+                except Exception as e:
+                    logger.error(f"Error polling Textract job for {image_path}: {str(e)}")
+                    settle(image_path, f"ERROR: {str(e)}")
+                del running[job_id]
+                finished += 1
+            
+            # Back off while jobs are still running, poll quickly again once they finish
+            delay = 1.0 if finished else min(delay * 2, 16.0)
+    finally:
+        for i in range(0, len(uploaded_keys), 1000):
+            try:
+                s3_client.delete_objects(
+                    Bucket=bucket,
+                    Delete={'Objects': [{'Key': key} for key in uploaded_keys[i:i + 1000]], 'Quiet': True}
+                )
+            except Exception as e:
+                logger.warning(f"Could not clean up S3 objects under {prefix}: {str(e)}")
+    
+    return texts
+
+def classify_receipt(text: str, memo: Optional[MemoCache] = None) -> str:
+    """Classify receipt type by keyword matching on the extracted text, reusing memoized results"""
+    try:
+        memo_key = ('classification', text)
+        classification = memo.get(memo_key) if memo else None
+        if classification is None:
+            classification = _classify_text(text)
+            if memo:
+                memo.put(memo_key, classification)
+        return classification
     except Exception as e:
         logger.error(f"Error classifying receipt: {str(e)}")
         return 'Other'
 
+def _classify_text(text: str) -> str:
+    """Score receipt text against the keyword lists"""
+    # Score each receipt type: one point per distinct keyword found.
+    # The text is case-folded once and scanned once by the automaton.
+    # Seeding every type at zero keeps ties going to the type listed first.
+    found = dict(_find_keywords(text.casefold()))
+    scores = Counter(dict.fromkeys(_RECEIPT_KEYWORDS, 0))
+    scores.update(receipt_type for receipt_types in found.values() for receipt_type in receipt_types)
+    
+    # Return the type with highest score, default to 'Other' if no match
+    best_type, best_score = max(scores.items(), key=lambda item: item[1])
+    return best_type if best_score > 0 else 'Other'
+
 def extract_date_and_total(text: str) -> Tuple[Optional[str], Optional[float]]:
     """Extract date and total amount from receipt text"""
-    date_patterns = [
-        r'(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})',  # MM/DD/YYYY or DD/MM/YYYY
-        r'(\d{1,2})\s+(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\s+(\d{2,4})',  # DD Month YYYY
-        r'(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\s+(\d{1,2}),?\s+(\d{2,4})',  # Month DD, YYYY
-    ]
-    
-    # Enhanced total patterns - look for various receipt total indicators
-    total_patterns = [
-        # Primary total patterns
-        r'total[:\s]*\$?(\d+\.?\d*)',
-        r'grand\s+total[:\s]*\$?(\d+\.?\d*)',
-        r'amount[:\s]*\$?(\d+\.?\d*)',
-        r'value[:\s]*\$?(\d+\.?\d*)',
-        r'balance[:\s]*\$?(\d+\.?\d*)',
-        r'charge[:\s]*\$?(\d+\.?\d*)',
-        r'payment[:\s]*\$?(\d+\.?\d*)',
-        
-        # Subtotal patterns (often the final amount)
-        r'subtotal[:\s]*\$?(\d+\.?\d*)',
-        r'sub\s*total[:\s]*\$?(\d+\.?\d*)',
-        
-        # Common receipt phrases
-        r'amount\s+due[:\s]*\$?(\d+\.?\d*)',
-        r'total\s+due[:\s]*\$?(\d+\.?\d*)',
-        r'balance\s+due[:\s]*\$?(\d+\.?\d*)',
-        r'final\s+total[:\s]*\$?(\d+\.?\d*)',
-        r'final\s+amount[:\s]*\$?(\d+\.?\d*)',
-        
-        # Dollar amounts at end of lines (common in receipts)
-        r'\$(\d+\.?\d*)\s*$',  # Dollar amount at end of line
-        r'\$(\d+\.?\d*)\s*\n',  # Dollar amount followed by newline
-        
-        # Amounts with currency symbols
-        r'[\$£€¥](\d+\.?\d*)',  # Various currency symbols
-        
-        # Amounts in parentheses (sometimes used for totals)
-        r'\([\$£€¥]?(\d+\.?\d*)\)',
-        
-        # Amounts with "USD" or "CAD" etc.
-        r'(\d+\.?\d*)\s*(USD|CAD|EUR|GBP)',
-    ]
-    
     # Extract date
     extracted_date = None
-    for pattern in date_patterns:
-        match = re.search(pattern, text.lower())
+    for pattern, is_month_name in _DATE_PATTERNS:
+        match = pattern.search(text)
         if match:
             try:
-                if 'jan' in pattern or 'feb' in pattern:  # Month name pattern
-                    month_map = {
-                        'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
-                        'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12
-                    }
+                if is_month_name:  # Month name pattern
                     if len(match.groups()) == 3:
                         if match.group(1).isdigit():
                             day, month_name, year = match.groups()
                         else:
                             month_name, day, year = match.groups()
-                        month = month_map.get(month_name[:3], 1)
+                        month = _MONTH_MAP.get(month_name[:3].lower(), 1)
                         year = int(year) if len(year) == 4 else int('20' + year)
-                        extracted_date = datetime(year, month, int(day)).strftime('%d %B %Y')
+                        datetime(year, month, int(day))  # Validates the day, including leap years
+                        extracted_date = f"{int(day):02d} {_MONTHS[month]} {year}"
                 else:  # Numeric date pattern
                     groups = match.groups()
                     if len(groups) == 3:
@@ -181,7 +573,9 @@ def extract_date_and_total(text: str) -> Tuple[Optional[str], Optional[float]]:
                         else:  # DD/MM/YYYY
                             day, month, year = groups
                         year = int(year) if len(year) == 4 else int('20' + year)
-                        extracted_date = datetime(year, int(month), int(day)).strftime('%d %B %Y')
+                        month = int(month)
+                        datetime(year, month, int(day))  # Validates the day, including leap years
+                        extracted_date = f"{int(day):02d} {_MONTHS[month]} {year}"
                 break
             except (ValueError, IndexError):
                 continue
@@ -190,36 +584,21 @@ def extract_date_and_total(text: str) -> Tuple[Optional[str], Optional[float]]:
     extracted_total = None
     total_matches = []
     
-    # First pass: collect all potential total matches
-    for pattern in total_patterns:
-        matches = re.finditer(pattern, text.lower())
-        for match in matches:
-            try:
-                amount = float(match.group(1))
-                # Store match with pattern priority and position
-                priority = 0
-                if 'total' in pattern and 'grand' in pattern:
-                    priority = 10  # Highest priority for grand total
-                elif 'total' in pattern:
-                    priority = 9   # High priority for total
-                elif 'subtotal' in pattern:
-                    priority = 8   # Good priority for subtotal
-                elif 'amount' in pattern or 'value' in pattern:
-                    priority = 7   # Medium priority for amount/value
-                elif 'balance' in pattern or 'due' in pattern:
-                    priority = 6   # Medium priority for balance/due
-                else:
-                    priority = 5   # Lower priority for other patterns
-                
-                total_matches.append({
-                    'amount': amount,
-                    'priority': priority,
-                    'pattern': pattern,
-                    'position': match.start(),
-                    'match_text': match.group(0)
-                })
-            except (ValueError, IndexError):
-                continue
+    # First pass: collect all potential total matches in a single scan
+    for match in _TOTAL_RE.finditer(text):
+        try:
+            # The amount is the first group inside the matching named branch
+            amount = float(match.group(match.lastindex + 1))
+            # Store match with branch priority and position
+            total_matches.append({
+                'amount': amount,
+                'priority': _TOTAL_PRIORITY[match.lastgroup],
+                'pattern': match.lastgroup,
+                'position': match.start(),
+                'match_text': match.group(0)
+            })
+        except (ValueError, IndexError):
+            continue
     
     # Second pass: select the best total
     if total_matches:
@@ -235,12 +614,16 @@ def extract_date_and_total(text: str) -> Tuple[Optional[str], Optional[float]]:
     
     return extracted_date, extracted_total
 
-def process_receipt_file(textract_client, comprehend_client, file_path: str) -> Dict:
+def process_receipt_file(textract_client, file_path: str, image_bytes: Optional[bytes] = None,
+                         limiter: Optional[RateLimiter] = None, memo: Optional[MemoCache] = None) -> Dict:
     """Process a single receipt file and return extracted information"""
+    # Extract text from image
+    extracted_text = extract_text_from_image(textract_client, file_path, image_bytes, limiter, memo)
+    return summarize_receipt(file_path, extracted_text, memo)
+
+def summarize_receipt(file_path: str, extracted_text: str, memo: Optional[MemoCache] = None) -> Dict:
+    """Classify extracted receipt text and build the result for a file"""
     try:
-        # Extract text from image
-        extracted_text = extract_text_from_image(textract_client, file_path)
-        
         if extracted_text.startswith("ERROR:"):
             return {
                 'file_path': file_path,
@@ -264,7 +647,7 @@ def process_receipt_file(textract_client, comprehend_client, file_path: str) ->
             }
         
         # Classify receipt
-        classification = classify_receipt(comprehend_client, extracted_text)
+        classification = classify_receipt(extracted_text, memo)
         
         # Extract date and total
         date, total = extract_date_and_total(extracted_text)
@@ -286,7 +669,7 @@ def process_receipt_file(textract_client, comprehend_client, file_path: str) ->
             'date': date,
             'total': total,
             'new_filename': new_filename,
-            'extracted_text': extracted_text[:200] + "..." if len(extracted_text) > 200 else extracted_text,
+            'extracted_text': extracted_text,
             'error': None
         }
         
@@ -298,32 +681,215 @@ def process_receipt_file(textract_client, comprehend_client, file_path: str) ->
             'date': None,
             'total': None,
             'new_filename': None,
+            'extracted_text': '',
             'error': str(e)
         }
 
-def rename_file(old_path: str, new_filename: str) -> bool:
-    """Rename file with new filename"""
-    try:
-        if not new_filename:
-            return False
-            
+def plan_renames(results: List[Dict]) -> List[Tuple[str, str]]:
+    """Work out collision-free (old path, new path) pairs for the renameable results.
+    
+    Each folder is listed once and candidate names are checked against that
+    listing in memory, so no per-candidate filesystem checks are needed.
+    """
+    taken_names = {}
+    plan = []
+    for result in results:
+        if not result['new_filename'] or result['error'] or result.get('renamed'):
+            continue
+        
+        old_path = Path(result['file_path'])
         # Clean filename for filesystem
-        clean_filename = re.sub(r'[<>:"/\\|?*]', '_', new_filename)
-        file_extension = Path(old_path).suffix
-        new_path = Path(old_path).parent / f"{clean_filename}{file_extension}"
+        clean_filename = _BAD_FN_CHARS.sub('_', result['new_filename'])
+        file_extension = old_path.suffix
+        new_name = f"{clean_filename}{file_extension}"
+        if old_path.name == new_name:
+            continue  # Already renamed
+        
+        # Names are compared case-insensitively to be safe on Windows and macOS
+        if old_path.parent not in taken_names:
+            with os.scandir(old_path.parent) as entries:
+                taken_names[old_path.parent] = {entry.name.lower() for entry in entries}
+        names = taken_names[old_path.parent]
         
-        # Handle duplicate filenames
+        # Handle duplicate filenames, including ones planned earlier in this batch
         counter = 1
-        original_new_path = new_path
-        while new_path.exists():
-            new_path = Path(str(original_new_path).replace(file_extension, f"_{counter}{file_extension}"))
+        while new_name.lower() in names:
+            new_name = f"{clean_filename}_{counter}{file_extension}"
             counter += 1
-        
-        os.rename(old_path, new_path)
+        names.add(new_name.lower())
+        plan.append((str(old_path), str(old_path.parent / new_name)))
+    return plan
+
+def _reserve_path(path: str) -> bool:
+    """Atomically create an empty placeholder at path; False if something already exists there"""
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
         return True
+    except FileExistsError:
+        return False
+
+def rename_file(old_path: str, new_path: str) -> Optional[str]:
+    """Rename file to a destination chosen by plan_renames and return where it ended up.
+    
+    The destination is reserved atomically before the file is moved onto it, so a file
+    created there since the folder was listed is never overwritten; a random suffix is
+    used instead. Returns None if the rename failed.
+    """
+    try:
+        if not _reserve_path(new_path):
+            stem, extension = os.path.splitext(new_path)
+            new_path = f"{stem}_{uuid.uuid4().hex[:6]}{extension}"
+            if not _reserve_path(new_path):
+                raise FileExistsError(f"File already exists: {new_path}")
+        try:
+            os.replace(old_path, new_path)
+        except OSError:
+            os.remove(new_path)
+            raise
+        return new_path
     except Exception as e:
         logger.error(f"Error renaming file {old_path}: {str(e)}")
-        return False
+        return None
+
+def run_processing(textract_client, s3_client, s3_bucket: str,
+                   files: List[Tuple[str, Optional[bytes]]], max_workers: int,
+                   limiters: Tuple[RateLimiter, RateLimiter, RateLimiter], memo: MemoCache, updates: queue.Queue):
+    """Process receipts on a background thread, reporting (index, result) pairs on a queue.
+    
+    files holds (file path or upload name, uploaded bytes or None) pairs. When an
+    S3 bucket is configured, PDFs on disk (and every supported file in large
+    folders) go through asynchronous Textract jobs alongside the direct calls for
+    the rest. limiters holds the (direct call, job start, job poll) Textract rate
+    limiters and memo the in-memory result cache, both fetched on the script thread.
+    None is put on the queue once every file has a result.
+    """
+    sync_limiter, start_limiter, get_limiter = limiters
+    done = set()
+    try:
+        batch = []
+        if s3_bucket:
+            large_folder = len(files) > _ASYNC_BATCH_THRESHOLD
+            for i, (file_path, image_bytes) in enumerate(files):
+                suffix = Path(file_path).suffix.lower()
+                if image_bytes is None and (suffix == '.pdf' or (large_folder and suffix in _ASYNC_EXTENSIONS)):
+                    batch.append(i)
+        in_batch = set(batch)
+        remaining = [i for i in range(len(files)) if i not in in_batch]
+        
+        # Report each S3 batch receipt as soon as its text is known
+        batch_index = {files[i][0]: i for i in batch}
+        
+        def report_text(file_path, extracted_text):
+            i = batch_index[file_path]
+            updates.put((i, summarize_receipt(file_path, extracted_text, memo)))
+            done.add(i)
+        
+        # AWS calls are I/O bound, so run several files concurrently. The S3 batch
+        # mostly waits on Textract jobs, so it gets a thread of its own.
+        with ThreadPoolExecutor(max_workers=max_workers + bool(batch)) as executor:
+            futures = {}
+            if batch:
+                futures[executor.submit(process_receipts_async, textract_client, s3_client, s3_bucket,
+                                        list(batch_index), on_text=report_text,
+                                        start_limiter=start_limiter, get_limiter=get_limiter, memo=memo)] = None
+            for i in remaining:
+                futures[executor.submit(process_receipt_file, textract_client, *files[i], sync_limiter, memo)] = i
+            for future in as_completed(futures):
+                if futures[future] is None:
+                    # A failed batch only fails its own receipts that weren't reported yet
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logger.error(f"Error processing S3 batch: {str(e)}")
+                        for i in batch:
+                            if i not in done:
+                                updates.put((i, summarize_receipt(files[i][0], f"ERROR: {str(e)}")))
+                                done.add(i)
+                else:
+                    updates.put((futures[future], future.result()))
+                    done.add(futures[future])
+    except Exception as e:
+        logger.error(f"Error processing receipts: {str(e)}")
+        for i, (file_path, _) in enumerate(files):
+            if i not in done:
+                updates.put((i, {
+                    'file_path': file_path,
+                    'classification': 'Error',
+                    'date': None,
+                    'total': None,
+                    'new_filename': None,
+                    'extracted_text': '',
+                    'error': str(e)
+                }))
+    finally:
+        updates.put(None)
+
+def start_processing(textract_client, s3_client, s3_bucket: str,
+                     files: List[Tuple[str, Optional[bytes]]], max_workers: int,
+                     limiters: Tuple[RateLimiter, RateLimiter, RateLimiter], source: str):
+    """Start processing receipts in the background and track the run in session state"""
+    updates = queue.Queue()
+    worker = threading.Thread(
+        target=run_processing,
+        args=(textract_client, s3_client, s3_bucket, files, max_workers, limiters, get_memo_cache(), updates),
+        daemon=True
+    )
+    st.session_state['worker'] = worker
+    st.session_state['worker_updates'] = updates
+    st.session_state['worker_results'] = [None] * len(files)
+    st.session_state['worker_source'] = source
+    st.session_state.pop('processing_results', None)
+    worker.start()
+
+def render_results(results: List[Dict], show_extracted_text: bool):
+    """Show the summary, results table and optional text samples for processed receipts"""
+    # Display results
+    st.header("📊 Processing Results")
+    
+    # Summary statistics
+    classifications = [r['classification'] for r in results if r['classification'] != 'Error']
+    if classifications:
+        st.subheader("Receipt Classifications")
+        classification_counts = {}
+        for classification in classifications:
+            classification_counts[classification] = classification_counts.get(classification, 0) + 1
+    
+        for classification, count in classification_counts.items():
+            st.write(f"• {classification}: {count} receipts")
+    
+    # Detailed results table
+    st.subheader("Detailed Results")
+    
+    # Build the display table column by column from a single DataFrame
+    df = pd.DataFrame.from_records(results)
+    display_data = pd.DataFrame({
+        'File': df['file_path'].map(lambda path: Path(path).name),
+        'Classification': df['classification'],
+        'Date': df['date'].fillna('Not found'),
+        'Total': df['total'].map(lambda total: f"${total:.2f}" if pd.notna(total) and total else 'Not found'),
+        'New Filename': df['new_filename'].fillna('Not generated'),
+        'Status': np.where(df['error'].isna(), '✅ Success', '❌ ' + df['error'].astype(str))
+    })
+    
+    st.dataframe(display_data, use_container_width=True)
+    
+    # Show extracted text if requested
+    if show_extracted_text:
+        st.subheader("Extracted Text Samples")
+        for result in results:
+            if result['extracted_text'] and not result['error']:
+                text = result['extracted_text']
+                with st.expander(f"Text from {Path(result['file_path']).name}"):
+                    st.text(text[:200] + "..." if len(text) > 200 else text)
+
+def list_subfolders(path: str) -> List[str]:
+    """Names of the visible subfolders of a folder, or an empty list if it cannot be read"""
+    try:
+        with os.scandir(path) as entries:
+            return sorted((entry.name for entry in entries
+                           if entry.is_dir() and not entry.name.startswith('.')), key=str.lower)
+    except OSError:
+        return []
 
 def main():
     st.set_page_config(
@@ -333,7 +899,7 @@ def main():
     )
     
     st.title("🧾 Receipt Processor")
-    st.markdown("Upload receipts and automatically classify, extract dates, and rename files using Amazon Textract and Comprehend")
+    st.markdown("Upload receipts and automatically classify, extract dates, and rename files using Amazon Textract")
     
     # Sidebar for configuration
     st.sidebar.header("Configuration")
@@ -341,8 +907,8 @@ def main():
     # AWS Status Check
     st.sidebar.subheader("AWS Status")
     try:
-        textract_client, comprehend_client = init_aws_clients()
-        if textract_client and comprehend_client:
+        textract_client, s3_client = init_aws_clients()
+        if textract_client:
             st.sidebar.success("✅ AWS Connected")
         else:
             st.sidebar.error("❌ AWS Connection Failed")
@@ -350,26 +916,15 @@ def main():
     except Exception as e:
         st.sidebar.error(f"❌ AWS Error: {str(e)}")
         textract_client = None
-        comprehend_client = None
+        s3_client = None
     
-    # Folder selection with browse button
+    # Folder selection
     st.sidebar.subheader("📁 Folder Selection")
     
     # Initialize session state for folder_path if not set
     if 'folder_path' not in st.session_state:
         st.session_state['folder_path'] = ''
     
-    # Handle Browse button
-    browse_clicked = st.sidebar.button("📂 Browse", help="Click to browse and select a folder")
-    if browse_clicked:
-        try:
-            selected_folder = select_folder()
-            if selected_folder:
-                st.session_state['folder_path'] = selected_folder
-                st.rerun()
-        except Exception as e:
-            st.sidebar.error(f"Error opening folder dialog: {str(e)}")
-    
     # Folder path input (value comes from session state)
     folder_path = st.sidebar.text_input(
         "Folder path:",
@@ -380,6 +935,28 @@ def main():
     if folder_path != st.session_state['folder_path']:
         st.session_state['folder_path'] = folder_path
     
+    # Browse by stepping into subfolders of the current folder (or the home folder)
+    browse_root = folder_path.strip('"') or str(Path.home())
+    subfolder = st.sidebar.selectbox(
+        "Browse subfolders:",
+        (['..'] if folder_path else []) + list_subfolders(browse_root),
+        index=None,
+        placeholder="Choose a folder",
+        key=f"browse_{browse_root}"
+    )
+    if subfolder:
+        st.session_state['folder_path'] = os.path.normpath(os.path.join(browse_root, subfolder))
+        st.rerun()
+    
+    # Uploaded receipts are processed in memory; files on disk are only needed for renaming
+    st.sidebar.subheader("📤 Upload Receipts")
+    uploaded_files = st.sidebar.file_uploader(
+        "Or upload receipt images:",
+        type=['jpg', 'jpeg', 'png', 'tiff', 'bmp', 'pdf'],
+        accept_multiple_files=True,
+        help="Uploaded receipts are classified but cannot be renamed on disk"
+    )
+    
     # File type filter
     st.sidebar.subheader("📄 File Types")
     file_extensions = st.sidebar.multiselect(
@@ -392,9 +969,58 @@ def main():
     st.sidebar.subheader("⚙️ Processing Options")
     auto_rename = st.sidebar.checkbox("Automatically rename files", value=True)
     show_extracted_text = st.sidebar.checkbox("Show extracted text", value=False)
+    max_workers = st.sidebar.slider(
+        "Parallel requests",
+        min_value=1,
+        max_value=32,
+        value=8,
+        help="Number of receipts sent to AWS at the same time. Lower this if you hit your Textract TPS quota."
+    )
+    rps_textract = st.sidebar.number_input(
+        "Textract requests per second:",
+        min_value=0.1,
+        value=15.0,
+        help="Direct Textract calls are spaced out to stay under this rate. Set it to your account's DetectDocumentText quota."
+    )
+    rps_textract_start = st.sidebar.number_input(
+        "Textract batch job starts per second:",
+        min_value=0.1,
+        value=5.0,
+        help="Rate for starting asynchronous Textract jobs. Set it to your account's StartDocumentTextDetection quota."
+    )
+    rps_textract_get = st.sidebar.number_input(
+        "Textract batch polls per second:",
+        min_value=0.1,
+        value=10.0,
+        help="Rate for job status checks and result pages. Set it to your account's GetDocumentTextDetection quota."
+    )
+    limiters = (get_rate_limiter('textract', rps_textract),
+                get_rate_limiter('textract-start', rps_textract_start),
+                get_rate_limiter('textract-get', rps_textract_get))
+    s3_bucket = st.sidebar.text_input(
+        "S3 bucket for batch OCR (optional):",
+        value=os.environ.get('RECEIPT_PROCESSOR_S3_BUCKET', ''),
+        help=f"PDFs, and every receipt in folders with more than {_ASYNC_BATCH_THRESHOLD} files, are uploaded here temporarily "
+             "and processed with asynchronous Textract jobs. Leave empty to always use direct calls."
+    ).strip()
+    
+    # A processing run keeps going on its own thread across reruns
+    processing = 'worker' in st.session_state
     
     # Main content area
-    if folder_path:
+    if uploaded_files:
+        st.info(f"{len(uploaded_files)} uploaded files ready to process.")
+        
+        if not textract_client:
+            st.error("❌ AWS services not available. Cannot process receipts.")
+            st.info("Please configure your AWS credentials using 'aws configure'")
+            st.info("See aws_setup_guide.md for detailed instructions.")
+        elif st.button("🚀 Process Receipts", type="primary", key="process_uploads", disabled=processing) and not processing:
+            files = [(uploaded.name, uploaded.getvalue()) for uploaded in uploaded_files]
+            start_processing(textract_client, s3_client, s3_bucket,
+                             files, max_workers, limiters, 'upload')
+            st.rerun()
+    elif folder_path:
         # Clean and normalize the path
         try:
             # Handle different path formats
@@ -412,14 +1038,15 @@ def main():
             if os.path.exists(folder_path):
                 st.success(f"✅ Folder found: {folder_path}")
                 
-                # Find image files
+                # Find image files in a single case-insensitive directory pass
                 image_files = []
-                for ext in file_extensions:
-                    try:
-                        image_files.extend(Path(folder_path).glob(f"*{ext}"))
-                        image_files.extend(Path(folder_path).glob(f"*{ext.upper()}"))
-                    except Exception as e:
-                        st.warning(f"Error searching for {ext} files: {str(e)}")
+                extensions = tuple(ext.lower() for ext in file_extensions)
+                try:
+                    with os.scandir(folder_path) as entries:
+                        image_files = [Path(entry.path) for entry in entries
+                                       if entry.is_file() and entry.name.lower().endswith(extensions)]
+                except Exception as e:
+                    st.warning(f"Error searching for image files: {str(e)}")
                 
                 if not image_files:
                     st.warning(f"No image files found in {folder_path} with selected extensions.")
@@ -448,70 +1075,17 @@ def main():
                             st.write(f"• {file_name}")
                     
                     # Check AWS status before allowing processing
-                    if not textract_client or not comprehend_client:
+                    if not textract_client:
                         st.error("❌ AWS services not available. Cannot process receipts.")
                         st.info("Please configure your AWS credentials using 'aws configure'")
                         st.info("See aws_setup_guide.md for detailed instructions.")
                     else:
                         # Process button
-                        if st.button("🚀 Process Receipts", type="primary"):
-                            progress_bar = st.progress(0)
-                            status_text = st.empty()
-                            
-                            results = []
-                            
-                            for i, file_path in enumerate(image_files):
-                                status_text.text(f"Processing {file_path.name}...")
-                                
-                                result = process_receipt_file(textract_client, comprehend_client, str(file_path))
-                                results.append(result)
-                                
-                                # Update progress
-                                progress_bar.progress((i + 1) / len(image_files))
-                            
-                            status_text.text("Processing complete!")
-                            
-                            # Store results in session state for later use
-                            st.session_state['processing_results'] = results
-                            
-                            # Display results
-                            st.header("📊 Processing Results")
-                            
-                            # Summary statistics
-                            classifications = [r['classification'] for r in results if r['classification'] != 'Error']
-                            if classifications:
-                                st.subheader("Receipt Classifications")
-                                classification_counts = {}
-                                for classification in classifications:
-                                    classification_counts[classification] = classification_counts.get(classification, 0) + 1
-                                
-                                for classification, count in classification_counts.items():
-                                    st.write(f"• {classification}: {count} receipts")
-                            
-                            # Detailed results table
-                            st.subheader("Detailed Results")
-                            
-                            # Prepare data for display
-                            display_data = []
-                            for result in results:
-                                display_data.append({
-                                    'File': Path(result['file_path']).name,
-                                    'Classification': result['classification'],
-                                    'Date': result['date'] or 'Not found',
-                                    'Total': f"${result['total']:.2f}" if result['total'] else 'Not found',
-                                    'New Filename': result['new_filename'] or 'Not generated',
-                                    'Status': '✅ Success' if not result['error'] else f"❌ {result['error']}"
-                                })
-                            
-                            st.dataframe(display_data, use_container_width=True)
-                            
-                            # Show extracted text if requested
-                            if show_extracted_text:
-                                st.subheader("Extracted Text Samples")
-                                for result in results:
-                                    if result['extracted_text'] and not result['error']:
-                                        with st.expander(f"Text from {Path(result['file_path']).name}"):
-                                            st.text(result['extracted_text'])
+                        if st.button("🚀 Process Receipts", type="primary", disabled=processing) and not processing:
+                            files = [(str(file_path), None) for file_path in image_files]
+                            start_processing(textract_client, s3_client, s3_bucket,
+                                             files, max_workers, limiters, 'folder')
+                            st.rerun()
             else:
                 st.error(f"❌ Folder not found: {folder_path}")
                 st.info("Please check the folder path and try again.")
@@ -540,74 +1114,109 @@ def main():
                 
         except Exception as e:
             st.error(f"❌ Error processing folder path: {str(e)}")
-            st.info("Please try entering the path manually or use the Browse button.")
+            st.info("Please check the folder path and try again.")
     else:
-        st.info("👈 Please select a folder using the Browse button or enter a folder path to get started.")
+        st.info("👈 Please enter a folder path or upload receipts to get started.")
+    
+    # Collect results from the background run; rerun until it has finished
+    if processing:
+        results = st.session_state['worker_results']
+        finished = False
+        updates = st.session_state['worker_updates']
+        while True:
+            try:
+                update = updates.get_nowait()
+            except queue.Empty:
+                break
+            if update is None:
+                finished = True
+                break
+            i, result = update
+            results[i] = result
+        
+        if finished:
+            # Store results in session state for later use
+            st.session_state['processing_results'] = results
+            st.session_state['processing_source'] = st.session_state['worker_source']
+            for key in ('worker', 'worker_updates', 'worker_results', 'worker_source'):
+                del st.session_state[key]
+        else:
+            completed = sum(1 for result in results if result is not None)
+            st.progress(completed / len(results))
+            st.text(f"Processed {completed}/{len(results)} files...")
+            # Show the receipts finished so far while the rest are still running
+            if completed:
+                render_results([result for result in results if result is not None], show_extracted_text=False)
+            time.sleep(_PROGRESS_INTERVAL)
+            st.rerun()
     
-    # Show rename button if we have results
-    if 'processing_results' in st.session_state and st.session_state['processing_results']:
+    if st.session_state.get('processing_results'):
+        render_results(st.session_state['processing_results'], show_extracted_text)
+    
+    # Show rename button if we have results for files on disk
+    if st.session_state.get('processing_source') == 'upload' and st.session_state.get('processing_results'):
+        st.info("Uploaded receipts can't be renamed on disk. Use the New Filename column to rename them yourself.")
+    elif 'processing_results' in st.session_state and st.session_state['processing_results']:
         st.header("📝 File Renaming")
         results = st.session_state['processing_results']
         
-        # Count files that can be renamed
-        renameable_files = [r for r in results if r['new_filename'] and not r['error']]
+        # Show the outcome of the last rename, kept across the rerun that refreshes the preview
+        summary = st.session_state.pop('rename_summary', None)
+        if summary:
+            successful_renames = sum(1 for row in summary if row['Status'].startswith('✅'))
+            if successful_renames:
+                st.success(f"✅ {successful_renames} of {len(summary)} files renamed successfully!")
+            else:
+                st.error("❌ No files were renamed. Check the log for details.")
+            st.subheader("📊 Rename Summary")
+            st.dataframe(summary, use_container_width=True)
         
-        if renameable_files:
-            st.info(f"Found {len(renameable_files)} files that can be renamed.")
+        # Work out the files that can be renamed and their collision-free names
+        try:
+            rename_plan = plan_renames(results)
+        except OSError as e:
+            st.error(f"❌ Error reading folder contents: {str(e)}")
+            rename_plan = []
+        
+        if rename_plan:
+            st.info(f"Found {len(rename_plan)} files that can be renamed.")
             
             # Show preview of what will be renamed
             with st.expander("📋 Preview Renames"):
-                for result in renameable_files:
-                    old_name = Path(result['file_path']).name
-                    new_name = f"{result['new_filename']}{Path(result['file_path']).suffix}"
-                    st.write(f"• {old_name} → {new_name}")
+                for old_path, new_path in rename_plan:
+                    st.write(f"• {Path(old_path).name} → {Path(new_path).name}")
             
             # Rename button
             if st.button("📝 Rename Files", type="secondary"):
-                rename_progress = st.progress(0)
-                rename_status = st.empty()
-                
-                successful_renames = 0
-                failed_renames = []
-                
-                for i, result in enumerate(renameable_files):
-                    old_name = Path(result['file_path']).name
-                    rename_status.text(f"Renaming {old_name}...")
-                    
-                    try:
-                        if rename_file(result['file_path'], result['new_filename']):
-                            successful_renames += 1
-                            st.success(f"✅ Renamed: {old_name}")
-                        else:
-                            failed_renames.append(old_name)
-                            st.error(f"❌ Failed to rename: {old_name}")
-                    except Exception as e:
-                        failed_renames.append(old_name)
-                        st.error(f"❌ Error renaming {old_name}: {str(e)}")
-                    
-                    rename_progress.progress((i + 1) / len(renameable_files))
+                rename_progress = st.progress(0.0, text=f"Renaming {len(rename_plan)} files...")
+                outcomes = [None] * len(rename_plan)
+                last_update = time.monotonic()
+                with ThreadPoolExecutor(max_workers=8) as executor:
+                    futures = {executor.submit(rename_file, *paths): i for i, paths in enumerate(rename_plan)}
+                    for completed, future in enumerate(as_completed(futures), 1):
+                        outcomes[futures[future]] = future.result()
+                        if time.monotonic() - last_update >= _PROGRESS_INTERVAL:
+                            rename_progress.progress(completed / len(rename_plan),
+                                                     text=f"Renamed {completed}/{len(rename_plan)} files...")
+                            last_update = time.monotonic()
                 
-                rename_status.text(f"Renaming complete! {successful_renames} files renamed successfully.")
-                
-                if successful_renames > 0:
-                    st.success(f"✅ {successful_renames} files renamed successfully!")
-                    
-                    # Show summary
-                    st.subheader("📊 Rename Summary")
-                    st.write(f"**Successfully renamed:** {successful_renames} files")
-                    
-                    if failed_renames:
-                        st.write(f"**Failed to rename:** {len(failed_renames)} files")
-                        with st.expander("Failed files"):
-                            for failed_file in failed_renames:
-                                st.write(f"• {failed_file}")
-                    
-                    # Update session state with new file paths
-                    st.session_state['processing_results'] = results
-                    st.rerun()
-                else:
-                    st.error("❌ No files were renamed. Check the error messages above.")
-        else:
+                # Update session state with new file paths
+                new_paths = {old_path: final_path for (old_path, _), final_path in zip(rename_plan, outcomes) if final_path}
+                for result in results:
+                    if result['file_path'] in new_paths:
+                        result['file_path'] = new_paths[result['file_path']]
+                        result['renamed'] = True
+                st.session_state['processing_results'] = results
+                st.session_state['rename_summary'] = [
+                    {
+                        'Original': Path(old_path).name,
+                        'Renamed To': Path(final_path or new_path).name,
+                        'Status': '✅ Renamed' if final_path else '❌ Failed'
+                    }
+                    for (old_path, new_path), final_path in zip(rename_plan, outcomes)
+                ]
+                st.rerun()
+        elif not summary:
             st.warning("No files can be renamed. Make sure files were processed successfully and have valid classifications, dates, and totals.")
     
     # Footer
@@ -616,7 +1225,7 @@ def main():
         """
         **How it works:**
         1. **Text Extraction**: Uses Amazon Textract to extract text from receipt images
-        2. **Classification**: Uses Amazon Comprehend to classify receipts by type
+        2. **Classification**: Classifies receipts by type from keywords in the extracted text
         3. **Data Extraction**: Extracts dates and total amounts using pattern matching
         4. **File Renaming**: Renames files with structured format: "Type - Date - Amount"
         